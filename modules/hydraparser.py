@@ -14,11 +14,23 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
-import json
-from typing import Dict
+from operator import itemgetter
+from typing import Any, Callable, Dict
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+try:
+    import simdjson as _simdjson
+except ImportError:
+    _simdjson = None
 
 from errors.errors import HydraDecodeError
 
+_login_and_password = itemgetter("login", "password")
+
 
 class HydraParser:
     """
@@ -51,13 +63,27 @@ class HydraParser:
 
         Raises:
         -------
-            json.decoder.JSONDecodeError: If the method can't load the file from the given path.
+            HydraDecodeError: If the method can't load the file from the given path.
         """
+        hydra_json: Dict = HydraParser._load(json_path, _json.loads)
+        return hydra_json
+
+    @staticmethod
+    def _lazy_opener(json_path: str):
+        """
+        Open the Hydra output as a lazy simdjson document, only the accessed values are converted to python objects.
+        A parser holds a single document, one is created per call to stay thread safe.
+        """
+        return HydraParser._load(json_path, lambda data: _simdjson.Parser().parse(data))
+
+    @staticmethod
+    def _load(json_path: str, loads: Callable[[bytes], Any]):
+        """Read the Hydra output and decode it with the given loads function"""
+        with open(json_path, "rb") as credentials:
+            data = credentials.read()
         try:
-            with open(json_path, "r", encoding="utf-8") as credentials:
-                hydra_json: Dict = json.load(credentials)
-            return hydra_json
-        except json.decoder.JSONDecodeError as e:
+            return loads(data)
+        except ValueError as e:
             raise HydraDecodeError(
                 f"Can't open the given file : {json_path}. Please make sure it is a JSON file."
             ) from e
@@ -79,11 +105,12 @@ class HydraParser:
         -------
             KeyError: If the method can't find the logins from the JSON file.
         """
-        hydra_output = HydraParser.json_opener(json_path)
+        if _simdjson is None:
+            hydra_output = HydraParser.json_opener(json_path)
+        else:
+            hydra_output = HydraParser._lazy_opener(json_path)
         try:
-            login = [login["login"] for login in hydra_output["results"]]
-            password = [password["password"] for password in hydra_output["results"]]
-            working_creds = dict(zip(login, password))
+            working_creds = dict(map(_login_and_password, hydra_output["results"]))
             return working_creds
         except KeyError as e:
             raise HydraDecodeError(f"Couldn't parse any Hydra information from the json file: {json_path}") from e
@@ -14,13 +14,20 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import functools
 import os
+import re
+import shlex
 import subprocess
+import sys
 import tempfile
 import logging
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ipaddress import ip_address
-from typing import Dict, Optional, List, Union
+from types import MappingProxyType
+from typing import Deque, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple, Union
 from errors.exceptions import ExceptionMessages
 from errors.errors import (
     HydraError,
@@ -32,6 +39,102 @@ from errors.errors import (
 )
 from modules.hydraparser import HydraParser
 
+_HYDRA_ARGS: Dict[str, str] = {
+    "UserWordlist": "-L",
+    "Username": "-l",
+    "PassWordlist": "-P",
+    "Password": "-p",
+    "Threads": "-t",
+    "OutputFilename": "-o",
+    "OutputType": "-b",
+    "IgnoreRestoreFile": "-I",
+    "Port": "-s",
+    "UserPassWordlist": "-C",
+}
+_F_USER_LIST, _F_USER, _F_PASS_LIST, _F_PASS, _F_USERPASS_LIST = (
+    _HYDRA_ARGS["UserWordlist"],
+    _HYDRA_ARGS["Username"],
+    _HYDRA_ARGS["PassWordlist"],
+    _HYDRA_ARGS["Password"],
+    _HYDRA_ARGS["UserPassWordlist"],
+)
+_F_THREADS, _F_OUT, _F_TYPE, _F_IGNORE = (
+    _HYDRA_ARGS["Threads"],
+    _HYDRA_ARGS["OutputFilename"],
+    _HYDRA_ARGS["OutputType"],
+    _HYDRA_ARGS["IgnoreRestoreFile"],
+)
+_VALID_OUTPUTS = frozenset(("text", "json", "jsonv1"))
+_SERVICE_WITHOUT_USER = frozenset(("redis", "adam6500", "cisco", "oracle-listener", "s7-300", "snmp", "vnc"))
+# Number of last hydra stderr lines kept to report an unknown error
+_STDERR_TAIL_SIZE = 50
+_HYDRA_MESSAGE_RE = re.compile(rb"\[(WARNING|ERROR)\]")
+# Hydra output files are written to a memory backed filesystem when available
+_OUTPUT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+
+@functools.lru_cache(maxsize=None)
+def _load_services(file_name: str) -> FrozenSet[str]:
+    """Read a services file shipped in the services folder, once per process"""
+    with open(os.path.join(os.path.dirname(__file__), "services", file_name), "r", encoding="utf-8") as f:
+        return frozenset(sys.intern(service) for service in f.read().splitlines())
+
+
+# Hydra binaries already found, a missing one is not remembered as it may be installed before the next try
+_KNOWN_HYDRA_PATHS: Set[str] = set()
+
+
+def _hydra_exists(hydra_path: str) -> bool:
+    """Check once per process that the hydra binary exists"""
+    if hydra_path in _KNOWN_HYDRA_PATHS:
+        return True
+    if os.path.exists(hydra_path):
+        _KNOWN_HYDRA_PATHS.add(hydra_path)
+        return True
+    return False
+
+
+# Absolute paths of the wordlists already found, only existing files are remembered
+_KNOWN_FILES: Set[str] = set()
+
+
+def _cached_isfile(path: str) -> bool:
+    """
+    Cached os.path.isfile, to avoid a stat per wordlist on each bruteforce.
+    Only existing files are cached, so usernames and passwords given instead of a wordlist are never stored.
+    Call clear_wordlist_cache() if the wordlists are removed while running.
+    """
+    abs_path = os.path.abspath(path)
+    if abs_path in _KNOWN_FILES:
+        return True
+    if os.path.isfile(abs_path):
+        _KNOWN_FILES.add(abs_path)
+        return True
+    return False
+
+
+def clear_wordlist_cache():
+    """Forget the wordlists already found, to use after removing or moving wordlists while running"""
+    _KNOWN_FILES.clear()
+
+
+def _validate_types(specs: Tuple[Tuple[str, object, Union[type, Tuple[type, ...]]], ...]):
+    """
+    Check the type of each (param_name, value, expected_type) given.
+
+    Raises
+    ------
+    TypeError
+        A parameter does not have the expected type
+    """
+    for param_name, value, expected_type in specs:
+        if not isinstance(value, expected_type):
+            if isinstance(expected_type, tuple):
+                expected_type = " or ".join(
+                    "None" if type_ is type(None) else type_.__name__ for type_ in expected_type
+                )
+            raise TypeError(ExceptionMessages.invalid_type(param_name, value, expected_type))
+
 
 class Hydra:
     """
@@ -42,6 +145,8 @@ class Hydra:
     -------
     bruteforce():
         Start the bruteforce.
+    bruteforce_many():
+        Start several bruteforces concurrently.
     """
 
     def __init__(self, ip: str, hydra_path: str = "/usr/bin/hydra"):
@@ -52,26 +157,17 @@ class Hydra:
                 An IPv6 or IPv4 IP.
         """
         self.ip = ip_address(ip)
-        if not os.path.exists(hydra_path):
+        self._ip_str = str(self.ip)
+        if not _hydra_exists(hydra_path):
             raise AttributeError(
                 f"Hydra not found on path '{hydra_path}', "
                 f"please install it using : sudo apt install hydra\n"
                 f"If hydra is installed, provide the absolute path using hydra_path="
             )
         self.hydra_path = hydra_path
-        self.hydra_args: Dict[str, str] = {
-            "UserWordlist": "-L",
-            "Username": "-l",
-            "PassWordlist": "-P",
-            "Password": "-p",
-            "Threads": "-t",
-            "OutputFilename": "-o",
-            "OutputType": "-b",
-            "IgnoreRestoreFile": "-I",
-            "Port": "-s",
-            "UserPassWordlist": "-C",
-        }
-        self.valid_outputs: List = ["text", "json", "jsonv1"]
+        # Read-only view, the flags are shared by every instance
+        self.hydra_args: Mapping[str, str] = MappingProxyType(_HYDRA_ARGS)
+        self.valid_outputs = _VALID_OUTPUTS
 
         self.hydra_settings: Dict = {}
         for hydra_setting in self.hydra_args.values():
@@ -86,11 +182,9 @@ class Hydra:
         self.delete_export: bool = True
         self.ignore_restore_file: bool = True
 
-        self.service_without_user = ["redis", "adam6500", "cisco", "oracle-listener", "s7-300", "snmp", "vnc"]
-        with open(os.path.join(os.path.dirname(__file__), "services/supported_services"), "r", encoding="utf-8") as f:
-            self.supported_services = f.read().splitlines()
-        with open(os.path.join(os.path.dirname(__file__), "services/special_services"), "r", encoding="utf-8") as f:
-            self.unsupported_services = f.read().splitlines()
+        self.service_without_user = _SERVICE_WITHOUT_USER
+        self.supported_services = _load_services("supported_services")
+        self.unsupported_services = _load_services("special_services")
 
     def bruteforce(
         self,
@@ -140,48 +234,35 @@ class Hydra:
         # Check inputs
         if user_wordlist is None:
             logging.warning("No user wordlist given")
-        else:
-            if not isinstance(user_wordlist, str):
-                raise TypeError(ExceptionMessages.invalid_type("user_wordlist", user_wordlist, str))
-
         if pass_wordlist is None:
             logging.warning("No pass wordlist given")
-        else:
-            if not isinstance(pass_wordlist, str):
-                raise TypeError(ExceptionMessages.invalid_type("pass_wordlist", pass_wordlist, str))
 
-        if not isinstance(service, str):
-            raise TypeError(ExceptionMessages.invalid_type("service", service, str))
-
-        if not isinstance(port, str) and not isinstance(port, int):
-            raise TypeError(ExceptionMessages.invalid_type("port", port, "str or int"))
+        _validate_types(
+            (
+                ("user_wordlist", user_wordlist, (str, type(None))),
+                ("pass_wordlist", pass_wordlist, (str, type(None))),
+                ("service", service, str),
+                ("port", port, (str, int)),
+                ("threads", threads, int),
+                ("export_type", export_type, str),
+                ("ignore_restore_file", ignore_restore_file, bool),
+                ("wait_time", wait_time, int),
+            )
+        )
 
         try:
             port = int(port)
         except ValueError as e:
             raise ValueError(f"The port number should be an integer, {port} was given.") from e
 
-        if not isinstance(threads, int):
-            raise TypeError(ExceptionMessages.invalid_type("threads", threads, int))
-        if not isinstance(export_type, str):
-            raise TypeError(ExceptionMessages.invalid_type("export_type", export_type, str))
-
-        if not isinstance(ignore_restore_file, bool):
-            raise TypeError(ExceptionMessages.invalid_type("ignore_restore_file", ignore_restore_file, bool))
-
-        if not isinstance(wait_time, int):
-            raise TypeError(ExceptionMessages.invalid_type("wait_time", wait_time, int))
-
         if export_type not in self.valid_outputs:
             raise ValueError(f"{export_type} is not a valid export type, use 'text', 'json' or 'jsonv1'")
 
         if threads >= 65:
-            logging.info(f"Threads given is too high, {threads}, reducing to 64.")
-            self.threads = 64
-        else:
-            self.threads = threads
+            logging.info("Threads given is too high, %s, reducing to 64.", threads)
+            threads = 64
 
-        service = service.lower()
+        service = sys.intern(service.lower())
         export_type = export_type.lower()
 
         # Check if the given service is supported
@@ -190,8 +271,8 @@ class Hydra:
                 raise HydraUnsupportedServiceError(f"Unsupported service given : {service}")
             raise HydraUnknownServiceError(f"Unknown service: {service}")
 
-        with tempfile.NamedTemporaryFile() as tmp_file:
-            command_string = self._user_and_pass_wordlists_string_generator(
+        with tempfile.NamedTemporaryFile(dir=_OUTPUT_DIR) as tmp_file:
+            command_args = self._user_and_pass_wordlists_string_generator(
                 threads,
                 wait_time,
                 service,
@@ -202,7 +283,7 @@ class Hydra:
                 pass_wordlist,
                 tmp_file.name,
             )
-            self._running_command(command_string)
+            self._running_command(command_args)
             json_dict = HydraParser.json2dict(tmp_file.name)
 
         return json_dict
@@ -257,45 +338,36 @@ class Hydra:
         HydraUnknownServiceError
             Service unknown
         """
-        if not isinstance(userpass_wordlist_path, str):
-            raise TypeError(ExceptionMessages.invalid_type("userpass_wordlist_path", userpass_wordlist_path, str))
-        if not os.path.isfile(os.path.abspath(userpass_wordlist_path)):
+        _validate_types(
+            (
+                ("userpass_wordlist_path", userpass_wordlist_path, str),
+                ("service", service, str),
+                ("port", port, (str, int)),
+                ("threads", threads, int),
+                ("export_type", export_type, str),
+                ("ignore_restore_file", ignore_restore_file, bool),
+                ("wait_time", wait_time, int),
+            )
+        )
+
+        if not os.path.isfile(userpass_wordlist_path):
             raise TypeError("Wordlist path does not exist")
 
         userpass_wordlist_path = os.path.abspath(userpass_wordlist_path)
 
-        if not isinstance(service, str):
-            raise TypeError(ExceptionMessages.invalid_type("service", service, str))
-
-        if not isinstance(port, str) and not isinstance(port, int):
-            raise TypeError(ExceptionMessages.invalid_type("port", port, "str or int"))
-
         try:
             port = int(port)
         except ValueError as e:
             raise ValueError(f"The port number should be an integer, {port} was given.") from e
 
-        if not isinstance(threads, int):
-            raise TypeError(ExceptionMessages.invalid_type("threads", threads, int))
-        if not isinstance(export_type, str):
-            raise TypeError(ExceptionMessages.invalid_type("export_type", export_type, str))
-
-        if not isinstance(ignore_restore_file, bool):
-            raise TypeError(ExceptionMessages.invalid_type("ignore_restore_file", ignore_restore_file, bool))
-
-        if not isinstance(wait_time, int):
-            raise TypeError(ExceptionMessages.invalid_type("wait_time", wait_time, int))
-
         if export_type not in self.valid_outputs:
             raise ValueError(f"{export_type} is not a valid export type, use 'text', 'json' or 'jsonv1'")
 
         if threads >= 65:
-            logging.warning(f"Threads given is too high, {threads}, reducing to 64.")
-            self.threads = 64
-        else:
-            self.threads = threads
+            logging.warning("Threads given is too high, %s, reducing to 64.", threads)
+            threads = 64
 
-        service = service.lower()
+        service = sys.intern(service.lower())
         export_type = export_type.lower()
 
         # Check if the given service is supported
@@ -304,8 +376,8 @@ class Hydra:
                 raise HydraUnsupportedServiceError(f"Unsupported service given : {service}")
             raise HydraUnknownServiceError(f"Unknown service: {service}")
 
-        with tempfile.NamedTemporaryFile() as tmp_file:
-            command_string = self._userpass_wordlist_string_generator(
+        with tempfile.NamedTemporaryFile(dir=_OUTPUT_DIR) as tmp_file:
+            command_args = self._userpass_wordlist_string_generator(
                 threads,
                 wait_time,
                 service,
@@ -315,38 +387,89 @@ class Hydra:
                 userpass_wordlist_path,
                 tmp_file.name,
             )
-            self._running_command(command_string)
+            self._running_command(command_args)
             json_dict = HydraParser.json2dict(tmp_file.name)
 
         return json_dict
 
+    def bruteforce_many(self, jobs: List[Dict]) -> List[Union[Dict, Exception]]:
+        """
+        Run several bruteforces concurrently, each one in its own hydra process.
+        Every job targets this instance's IP: up to 32 hydra processes hit the same host at once,
+        use one Hydra object per host to bruteforce several hosts.
+
+        Parameters
+        ----------
+        jobs : List[Dict]
+            Keyword arguments of each bruteforce() call, for example:
+            [{"service": "ssh", "port": 22, "user_wordlist": "users.txt", "pass_wordlist": "pass.txt"}]
+
+        Returns
+        -------
+        List[Union[Dict, Exception]]
+            Working credentials of each job, in the same order as the given jobs.
+            A job that failed holds the exception it raised instead, the other jobs are not affected.
+
+        Raises
+        ------
+        TypeError
+            jobs is not a list of dictionaries
+        """
+        if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+            raise TypeError(ExceptionMessages.invalid_list_types("jobs", dict))
+        if not jobs:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(32, len(jobs))) as executor:
+            futures = [executor.submit(self.bruteforce, **job) for job in jobs]
+
+        results: List[Union[Dict, Exception]] = []
+        for future in futures:
+            error = future.exception()
+            results.append(future.result() if error is None else error)
+        return results
+
     @staticmethod
-    def _running_command(command_string: str):
+    def _running_command(command_args: List[str]):
         """Run a given Hydra command"""
-        logging.info(f"Running thc-hydra with following command : {command_string}")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("Running thc-hydra with following command : %s", shlex.join(command_args))
 
         with subprocess.Popen(
-            command_string.split(), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            command_args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
         ) as hydra_command:
 
-            exit_code = hydra_command.wait()
-            _, stderr = hydra_command.communicate()
-            hydra_messages = stderr.decode().split("\n")
+            first_error: Optional[bytes] = None
+            last_messages: Deque[bytes] = deque(maxlen=_STDERR_TAIL_SIZE)
+            messages_count = 0
+            user_wordlist_not_needed = False
+
+            for raw_message in hydra_command.stderr:
+                hydra_message = raw_message.rstrip(b"\n")
+                message_match = _HYDRA_MESSAGE_RE.match(hydra_message)
+                if message_match is not None:
+                    if message_match.group(1) == b"WARNING":
+                        logging.warning("%s", hydra_message.decode())
+                    elif first_error is None:
+                        first_error = hydra_message
+                if b"only using the -p or -P option" in hydra_message:
+                    user_wordlist_not_needed = True
+                last_messages.append(hydra_message)
+                messages_count += 1
 
-            for hydra_message in hydra_messages:
-                if hydra_message.startswith("[WARNING]"):
-                    logging.warning(hydra_message)
+            exit_code = hydra_command.wait()
             if exit_code != 0:
-
-                for hydra_error in hydra_messages:
-
-                    if "only using the -p or -P option" in hydra_error:
-                        logging.warning(
-                            "Service doesn't need a user wordlist. Restarting the command without it..."
-                        )  # pragma: no cover
-                    if hydra_error.startswith("[ERROR]"):
-                        raise HydraError(hydra_error)
-
+                if user_wordlist_not_needed:
+                    logging.warning(
+                        "Service doesn't need a user wordlist. Restarting the command without it..."
+                    )  # pragma: no cover
+                if first_error is not None:
+                    raise HydraError(first_error.decode())
+
+                # Only the last stderr lines are kept, tell how many were left out
+                hydra_messages = [hydra_message.decode() for hydra_message in last_messages]
+                if messages_count > len(last_messages):
+                    hydra_messages.insert(0, f"[... {messages_count - len(last_messages)} earlier lines omitted]")
                 raise UnknownHydraError(hydra_messages)
 
     def _userpass_wordlist_string_generator(
@@ -359,20 +482,20 @@ class Hydra:
         ignore_restore_file,
         userpass_wordlist,
         output_file_name,
-    ) -> str:
+    ) -> List[str]:
         """
-        Generate the command string when using a userpass wordlist
+        Generate the command arguments when using a userpass wordlist
         """
-        hydra_target = f"{service}://{self.ip}:{port}"
-        command_string = f"{self.hydra_path} {hydra_target} -w {wait_time}"
-        if os.path.isfile(userpass_wordlist):
-            command_string += f" {self.hydra_args['UserPassWordlist']} {userpass_wordlist}"
+        hydra_target = f"{service}://{self._ip_str}:{port}"
+        command_args = [self.hydra_path, hydra_target, "-w", str(wait_time)]
+        if _cached_isfile(userpass_wordlist):
+            command_args.extend((_F_USERPASS_LIST, userpass_wordlist))
         else:
             raise HydraFileDoesNotExist("Unable to find the file")
 
-        command_string += self._default_string_generator(threads, output_file_name, export_type, ignore_restore_file)
+        command_args.extend(self._default_string_generator(threads, output_file_name, export_type, ignore_restore_file))
 
-        return command_string
+        return command_args
 
     def _user_and_pass_wordlists_string_generator(
         self,
@@ -385,55 +508,55 @@ class Hydra:
         user_wordlist,
         pass_wordlist,
         output_file_name=None,
-    ) -> str:
-        """Generate the command string when using a users and passwords wordlists"""
-        hydra_target = f"{service}://{self.ip}:{port}"
-        command_string = f"{self.hydra_path} {hydra_target} -w {wait_time}"
+    ) -> List[str]:
+        """Generate the command arguments when using a users and passwords wordlists"""
+        hydra_target = f"{service}://{self._ip_str}:{port}"
+        command_args = [self.hydra_path, hydra_target, "-w", str(wait_time)]
 
-        if str(service) in self.service_without_user:
+        if service in self.service_without_user:
             logging.info("This service doesn't need a user wordlist, removing it.")
             user_wordlist = None
         else:
             if user_wordlist is not None:
-                if os.path.isfile(user_wordlist):
-                    command_string = command_string + f" {self.hydra_args['UserWordlist']} {user_wordlist}"
+                if _cached_isfile(user_wordlist):
+                    command_args.extend((_F_USER_LIST, user_wordlist))
                 else:
-                    logging.debug(f"Unable to find the file : {user_wordlist}, using it as a username")
-                    command_string = command_string + f" {self.hydra_args['Username']} {user_wordlist}"
+                    logging.debug("Unable to find the file : %s, using it as a username", user_wordlist)
+                    command_args.extend((_F_USER, user_wordlist))
             else:
                 raise HydraNoWordlistGiven("user_wordlist is None")
 
         if pass_wordlist is not None:
-            if os.path.isfile(pass_wordlist):
-                command_string = command_string + f" {self.hydra_args['PassWordlist']} {pass_wordlist}"
+            if _cached_isfile(pass_wordlist):
+                command_args.extend((_F_PASS_LIST, pass_wordlist))
             else:
-                logging.debug(f"Unable to find the file : {pass_wordlist}, using it as a password")
-                command_string = command_string + f" {self.hydra_args['Password']} {pass_wordlist}"
+                logging.debug("Unable to find the file : %s, using it as a password", pass_wordlist)
+                command_args.extend((_F_PASS, pass_wordlist))
         else:
             raise HydraNoWordlistGiven("pass_wordlist is None")
 
-        command_string += self._default_string_generator(threads, output_file_name, export_type, ignore_restore_file)
+        command_args.extend(self._default_string_generator(threads, output_file_name, export_type, ignore_restore_file))
 
-        return command_string
+        return command_args
 
-    def _default_string_generator(self, threads, output_file_name, export_type, ignore_restore_file) -> str:
+    def _default_string_generator(self, threads, output_file_name, export_type, ignore_restore_file) -> List[str]:
         """
-        Base string generator
+        Base arguments generator
         """
-        command_string = ""
+        command_args: List[str] = []
         if threads is not None:
-            command_string = command_string + f" {self.hydra_args['Threads']} {threads}"
+            command_args.extend((_F_THREADS, str(threads)))
 
         if output_file_name is not None:
-            command_string = command_string + f" {self.hydra_args['OutputFilename']} {output_file_name}"
+            command_args.extend((_F_OUT, output_file_name))
 
         if export_type is not None:
-            command_string = command_string + f" {self.hydra_args['OutputType']} {export_type}"
+            command_args.extend((_F_TYPE, export_type))
 
         if ignore_restore_file is True:
-            command_string = command_string + f" {self.hydra_args['IgnoreRestoreFile']}"
+            command_args.append(_F_IGNORE)
 
-        return command_string
+        return command_args
 
 
 if __name__ == "__main__":